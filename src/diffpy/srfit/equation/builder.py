@@ -92,12 +92,19 @@ _builders = {}
 import inspect
 import numbers
 import numpy
+from collections import OrderedDict
 
 import six
 
 import diffpy.srfit.equation.literals as literals
 from diffpy.srfit.equation.literals.literal import Literal
 from diffpy.srfit.equation.equationmod import Equation
+from diffpy.srfit.equation.visitors import swap
+
+# Parsed equation strings, see _getTokens and _getCode.
+_parsecachesize = 64
+_tokencache = OrderedDict()
+_codecache = OrderedDict()
 
 
 class EquationFactory(object):
@@ -148,7 +155,7 @@ class EquationFactory(object):
         Returns a callable Literal representing the equation string.
         """
         self._prepareBuilders(eqstr, buildargs, argclass, argkw)
-        beq = eval(eqstr, {}, self.builders)
+        beq = eval(_getCode(eqstr), {}, self.builders)
         # handle scalar numbers or numpy arrays
         if isinstance(beq, (numbers.Number, numpy.ndarray)):
             lit = literals.Argument(value=beq, const=True)
@@ -174,6 +181,20 @@ class EquationFactory(object):
         argbuilder = wrapArgument(name, arg)
         return self.registerBuilder(name, argbuilder)
 
+    def registerArguments(self, args):
+        """Register several named Arguments with the factory.
+
+        This is equivalent to calling registerArgument for each Argument, but
+        every equation in the factory is rebuilt only once.
+
+        args    --  Sequence of (name, arg) pairs.
+
+        Returns the list of registered builders.
+        """
+        items = [(name, wrapArgument(name, arg)) for name, arg in args]
+        self._registerBuilders(items)
+        return [b for name, b in items]
+
     def registerOperator(self, name, op):
         """Register an Operator literal with the factory.
 
@@ -227,24 +248,41 @@ class EquationFactory(object):
             raise TypeError("Name must be a string")
         if not isinstance(builder, BaseBuilder):
             raise TypeError("builder must be a BaseBuilder instance")
-        # Swap out the old builder's literal, if necessary
-        newlit = builder.literal
-        swapbyname = isinstance(builder, ArgumentBuilder)
-        bloldlits = set()
-        if name in self.builders:
-            bloldlits.add(self.builders[name].literal)
-        for eq in self.equations:
-            eqoldlits = bloldlits
-            if swapbyname and name in eq.argdict:
-                eqoldlits = bloldlits.union((eq.argdict[name],))
-            for oldlit in eqoldlits:
-                if oldlit is newlit:
-                    continue
-                eq.swap(oldlit, newlit)
-        # Now store the new builder
-        self.builders[name] = builder
+        self._registerBuilders([(name, builder)])
         return builder
 
+    def _registerBuilders(self, items):
+        """Store several builders and update the factory's equations.
+
+        items   --  Sequence of (name, builder) pairs.
+
+        The old literals of all builders are swapped out of each equation
+        before its root is reset, so each equation is validated once.
+        """
+        for eq in self.equations:
+            root = eq.root
+            swapped = False
+            for name, builder in items:
+                # Swap out the old builder's literal, if necessary
+                newlit = builder.literal
+                oldlits = set()
+                if name in self.builders:
+                    oldlits.add(self.builders[name].literal)
+                swapbyname = isinstance(builder, ArgumentBuilder)
+                if swapbyname and name in eq.argdict:
+                    oldlits.add(eq.argdict[name])
+                for oldlit in oldlits:
+                    if oldlit is newlit:
+                        continue
+                    root = swap(root, oldlit, newlit)
+                    swapped = True
+            if swapped:
+                eq.setRoot(root)
+        # Now store the new builders
+        for name, builder in items:
+            self.builders[name] = builder
+        return
+
     def deRegisterBuilder(self, name):
         """De-register a builder by name.
 
@@ -333,28 +371,7 @@ class EquationFactory(object):
 
         Raises SyntaxError if the equation string uses invalid syntax.
         """
-        import tokenize
-        import token
-
-        interface = six.StringIO(eqstr).readline
-        # output is an iterator. Each entry (token) is a 5-tuple
-        # token[0] = token type
-        # token[1] = token string
-        # token[2] = (srow, scol) - row and col where the token begins
-        # token[3] = (erow, ecol) - row and col where the token ends
-        # token[4] = line where the token was found
-        tokens = tokenize.generate_tokens(interface)
-
-        # Scan for tokens. Throw a SyntaxError if the tokenizer chokes.
-        args = set()
-
-        try:
-            for tok in tokens:
-                if tok[0] in (token.NAME, token.OP):
-                    args.add(tok[1])
-        except tokenize.TokenError:
-            m = "invalid syntax: '%s'"%eqstr
-            raise SyntaxError(m)
+        args = set(_getTokens(eqstr))
 
         # Scan the tokens for names that do not correspond to registered
         # builders. These will be treated as arguments that need to be
@@ -375,6 +392,74 @@ class EquationFactory(object):
 
 # End class EquationFactory
 
+
+def _getTokens(eqstr):
+    """Get the name and operator tokens of an equation string.
+
+    Recent results are cached in _tokencache.
+
+    Returns a frozenset of the token strings.
+    Raises SyntaxError if the equation string uses invalid syntax.
+    """
+    return _getCached(_tokencache, eqstr, _tokenize)
+
+
+def _tokenize(eqstr):
+    """Extract the name and operator tokens of an equation string.
+
+    Raises SyntaxError if the equation string uses invalid syntax.
+    """
+    import tokenize
+    import token
+
+    interface = six.StringIO(eqstr).readline
+    # output is an iterator. Each entry (token) is a 5-tuple
+    # token[0] = token type
+    # token[1] = token string
+    # token[2] = (srow, scol) - row and col where the token begins
+    # token[3] = (erow, ecol) - row and col where the token ends
+    # token[4] = line where the token was found
+    tokens = tokenize.generate_tokens(interface)
+
+    # Scan for tokens. Throw a SyntaxError if the tokenizer chokes.
+    args = set()
+
+    try:
+        for tok in tokens:
+            if tok[0] in (token.NAME, token.OP):
+                args.add(tok[1])
+    except tokenize.TokenError:
+        m = "invalid syntax: '%s'"%eqstr
+        raise SyntaxError(m)
+
+    return frozenset(args)
+
+
+def _getCode(eqstr):
+    """Get the compiled code object of an equation string.
+
+    Leading spaces and tabs are ignored as in eval of a string.  Recent
+    results are cached in _codecache.
+
+    Raises SyntaxError if the equation string uses invalid syntax.
+    """
+    compileeval = lambda s: compile(s.lstrip(' \t'), '<string>', 'eval')
+    return _getCached(_codecache, eqstr, compileeval)
+
+
+def _getCached(cache, eqstr, func):
+    """Get func(eqstr) from a cache of the recently used values.
+
+    The cache is an OrderedDict that keeps at most _parsecachesize items.
+    """
+    value = cache.pop(eqstr, None)
+    if value is None:
+        value = func(eqstr)
+    cache[eqstr] = value
+    while len(cache) > _parsecachesize:
+        cache.popitem(last=False)
+    return value
+
 class BaseBuilder(object):
     """Class for building equations.
 
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Compiled evaluation of Equation objects.
+
+JitEquation evaluates an Equation with a single numba-compiled function
+instead of walking its Literal tree.  The function source is generated from
+the tree, where the arithmetic operators and numpy ufuncs are translated to
+numpy calls.  Non-constant Arguments and any other Operators, for example
+ProfileGenerators, Calculators or registered python functions, become inputs
+of the compiled function and are evaluated as usual.
+
+This is an experimental feature that requires numba.  It is enabled when the
+environment variable DIFFPY_SRFIT_JIT is set to "1".
+"""
+
+__all__ = ["JIT_ENABLED", "JitEquation", "generateSource"]
+
+import os
+import numbers
+
+import numpy
+
+from diffpy.srfit.equation.visitors.visitor import Visitor
+from diffpy.srfit.fitbase._residualkernels import HAVE_NUMBA
+
+if HAVE_NUMBA:
+    import numba
+
+# Flag for using the compiled equations in FitContribution.
+JIT_ENABLED = HAVE_NUMBA and os.environ.get("DIFFPY_SRFIT_JIT") == "1"
+
+# numpy functions other than ufuncs that can be compiled.
+_NUMPYFUNCTIONS = (numpy.sum,)
+
+
+class JitEquation(object):
+    """Compiled evaluator of an Equation.
+
+    The compiled function is rebuilt when the Literal tree of the Equation
+    changes.  The result is cached until one of the function inputs
+    changes, which is then notified to the observers of the Equation.  The
+    Equation is evaluated in the usual way when its tree cannot be
+    compiled.
+
+    Attributes
+    eq      --  The Equation that is evaluated.
+    """
+
+    def __init__(self, eq):
+        """Initialize.
+
+        eq  --  The Equation to be evaluated.
+        """
+        self.eq = eq
+        self._reset()
+        return
+
+
+    def __call__(self):
+        """Evaluate the Equation at the current values of its inputs.
+        """
+        if self.eq.argdict is not self._argdict:
+            self._compile()
+        if self._func is None:
+            return self.eq()
+        if self._value is None:
+            vals = [lit.getValue() for lit in self._inputs]
+            try:
+                self._value = self._func(*vals)
+            except Exception:
+                # Leave the error reporting to the Equation.
+                self._func = None
+                return self.eq()
+            # Store the value in the Equation so that it notifies its
+            # observers when the inputs change.
+            self.eq._value = self._value
+        return self._value
+
+
+    def _compile(self):
+        """Build the compiled function for the current Equation tree.
+        """
+        self._release()
+        self._argdict = self.eq.argdict
+        src, inputs = generateSource(self.eq)
+        # Nothing to gain when there are no numpy operations.
+        if "numpy." not in src:
+            return
+        ns = {"numpy" : numpy}
+        exec(src, ns)
+        self._func = numba.njit(ns["_jitfunc"], nogil=True)
+        self._inputs = inputs
+        for lit in self._inputs:
+            lit.addObserver(self._flush)
+        return
+
+
+    def _release(self):
+        """Stop observing the inputs and drop the compiled function.
+        """
+        for lit in self._inputs:
+            if lit.hasObserver(self._flush):
+                lit.removeObserver(self._flush)
+        self._reset()
+        return
+
+
+    def _reset(self):
+        self._argdict = None
+        self._inputs = []
+        self._func = None
+        self._value = None
+        return
+
+
+    def _flush(self, other):
+        """Invalidate the cached value and flush the Equation."""
+        self._value = None
+        self.eq._flush(other)
+        return
+
+
+    def __getstate__(self):
+        """Drop the compiled function, it gets rebuilt when needed."""
+        return {"eq" : self.eq}
+
+
+    def __setstate__(self, state):
+        self.eq = state["eq"]
+        self._reset()
+        return
+
+# End class JitEquation
+
+
+def generateSource(eq):
+    """Generate python source for evaluating an Equation.
+
+    eq  --  The Equation or another Literal tree.
+
+    Return a tuple of the source string and the list of input Literals.
+    The source defines function _jitfunc which takes the values of the
+    inputs as positional arguments in the same order.
+    """
+    v = _SourceGenerator()
+    expr = eq.identify(v)
+    anames = ["a%i" % i for i in range(len(v.inputs))]
+    src = "def _jitfunc(%s):\n    return %s\n" % (", ".join(anames), expr)
+    return src, v.inputs
+
+
+class _SourceGenerator(Visitor):
+    """Visitor that translates a Literal tree to a python expression.
+
+    Attributes
+    inputs  --  The list of Literals that are inputs to the expression.
+    """
+
+    def __init__(self):
+        self.inputs = []
+        return
+
+
+    def onArgument(self, arg):
+        """Process an Argument node.
+
+        Unnamed scalar constants, which the equation builder creates for
+        numbers in the equation string, are inlined.  Other arguments
+        become inputs, including named constants whose value can change.
+        """
+        value = arg.value
+        isscalar = (isinstance(value, numbers.Real) and
+                    not isinstance(value, bool))
+        if arg.const and arg.name is None and isscalar:
+            if isinstance(value, numbers.Integral):
+                return repr(int(value))
+            return repr(float(value))
+        return self._addInput(arg)
+
+
+    def onOperator(self, op):
+        """Process an Operator node.
+
+        Operators other than the numpy-based ones become inputs.
+        """
+        f = op.operation
+        fname = getattr(f, "__name__", None)
+        isnumpy = (getattr(numpy, str(fname), None) is f and
+                   (isinstance(f, numpy.ufunc) and f.nout == 1 or
+                    f in _NUMPYFUNCTIONS))
+        if not isnumpy:
+            return self._addInput(op)
+        args = [lit.identify(self) for lit in op.args]
+        return "numpy.%s(%s)" % (fname, ", ".join(args))
+
+
+    def onEquation(self, eq):
+        """Process an Equation node by expanding its tree."""
+        return eq.root.identify(self)
+
+
+    def _addInput(self, lit):
+        """Register an input Literal and return its argument name."""
+        for idx, inp in enumerate(self.inputs):
+            if inp is lit:
+                break
+        else:
+            idx = len(self.inputs)
+            self.inputs.append(lit)
+        return "a%i" % idx
+
+# End class _SourceGenerator
+
+# End of file
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+##############################################################################
+#
+# diffpy.srfit      by DANSE Diffraction group
+#                   Simon J. L. Billinge
+#                   (c) 2008 The Trustees of Columbia University
+#                   in the City of New York.  All rights reserved.
+#
+# See AUTHORS.txt for a list of people who contributed.
+# See LICENSE_DANSE.txt for license information.
+#
+##############################################################################
+
+"""Compiled kernels for the preset residuals of a FitContribution.
+
+The kernels evaluate the chiv and resv residuals in a single pass over the
+data arrays.  They release the GIL, so that FitRecipe can evaluate several
+FitContributions concurrently.  The kernels require the optional numba
+package.  When numba is not available HAVE_NUMBA is False, the kernels are
+not defined and the FitContribution uses plain numpy expressions instead.
+
+The kernels are compiled on first use and cached on disk.  Set the
+environment variable DIFFPY_SRFIT_EAGER_JIT to "1" to compile them at
+import instead, so that the first residual evaluation of a fit does not pay
+the compilation time.
+"""
+
+__all__ = ["HAVE_NUMBA", "KERNEL_MINSIZE"]
+
+import os
+
+import numpy
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    HAVE_NUMBA = False
+
+# Use the kernels for arrays of at least this size.  Plain numpy expressions
+# are faster for short arrays where the call overhead dominates.
+KERNEL_MINSIZE = 1024
+
+
+if HAVE_NUMBA:
+
+    __all__ += ["chivKernel", "resvKernel"]
+
+    @numba.njit(cache=True, fastmath=True, nogil=True)
+    def chivKernel(ycalc, y, invdy, out):
+        """Store (ycalc - y) * invdy in the out array and return it.
+
+        invdy is the reciprocal of the uncertainty array dy.
+        """
+        for i in range(ycalc.size):
+            out[i] = (ycalc[i] - y[i]) * invdy[i]
+        return out
+
+
+    @numba.njit(cache=True, fastmath=True, nogil=True)
+    def resvKernel(ycalc, y, scale, out):
+        """Store (ycalc - y) * scale in the out array and return it.
+        """
+        for i in range(ycalc.size):
+            out[i] = (ycalc[i] - y[i]) * scale
+        return out
+
+
+    # Compile the kernels now when requested.  Failures are reported when
+    # the kernels get used.
+    if os.environ.get("DIFFPY_SRFIT_EAGER_JIT") == "1":
+        try:
+            _a = numpy.zeros(4)
+            chivKernel(_a, _a, numpy.ones(4), numpy.zeros(4))
+            resvKernel(_a, _a, 1.0, numpy.zeros(4))
+            del _a
+        except Exception:
+            pass
+
+# End of file
@@ -98,6 +98,16 @@ class Calculator(Operator, ParameterSet):
         return self._value
 
 
+    def getValue(self):
+        """Get or evaluate the value of the calculator.
+
+        This calls __call__ directly with the values of the arguments.
+        """
+        if self._value is None:
+            self._value = self(*[l.getValue() for l in self.args])
+        return self._value
+
+
     def _validate(self):
         """Validate my state.
 
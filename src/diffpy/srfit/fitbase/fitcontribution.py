@@ -25,12 +25,22 @@ See the examples in the documention for how to use a FitContribution.
 
 __all__ = ["FitContribution"]
 
+from collections import OrderedDict
+from itertools import chain
+
+import numpy
+
 from diffpy.srfit.fitbase.parameterset import ParameterSet
 from diffpy.srfit.fitbase.recipeorganizer import equationFromString
 from diffpy.srfit.fitbase.parameter import ParameterProxy
 from diffpy.srfit.fitbase.profile import Profile
+from diffpy.srfit.fitbase._residualkernels import HAVE_NUMBA, KERNEL_MINSIZE
+from diffpy.srfit.fitbase._equationjit import JIT_ENABLED, JitEquation
 from diffpy.srfit.exceptions import SrFitError
 
+if HAVE_NUMBA:
+    from diffpy.srfit.fitbase._residualkernels import chivKernel, resvKernel
+
 class FitContribution(ParameterSet):
     """FitContribution class.
 
@@ -55,7 +65,33 @@ class FitContribution(ParameterSet):
                         instance that is used to create constraints and
                         restraints from string
     _eq             --  The FitContribution equation that will be optimized.
+    _eqjit          --  JitEquation for compiled evaluation of _eq or None.
+                        Used only when the DIFFPY_SRFIT_JIT environment
+                        variable is "1" and numba is available.
     _reseq          --  The residual equation.
+    _reseqkind      --  "chiv" or "resv" when the residual equation is one of
+                        the preset residuals, otherwise None.  The preset
+                        residuals are evaluated directly with numpy.
+    _lastres        --  The last preset residual, which is returned again
+                        until the equation or the Profile change.
+    _ycache         --  Contiguous copy of the profile y array or None.
+    _invdycache     --  Reciprocal of the profile dy array or None.
+    _resvscale      --  The resv scale 1/sqrt(dot(y, y)) or None.
+    _resbuf         --  Array that receives the preset residual (or None).
+    _resdtype       --  Floating point type for evaluating the preset
+                        residuals or None for the default float64.  See
+                        setResidualDtype.
+    _eqmemo         --  An OrderedDict of copies of recent _eq values
+                        indexed by the values of the _eq arguments and the
+                        contained Parameters.  Used by the preset residuals,
+                        see setEquationMemo.
+    _eqmemosize     --  Maximum number of entries in _eqmemo, 0 when the
+                        memo is disabled.
+    _reseqcache     --  An OrderedDict of recently used residual equations,
+                        indexed by the equation string.  Used to skip
+                        re-parsing in setResidualEquation.
+    _profileproxies --  Tuple of the ParameterProxy objects for the x, y
+                        and dy variables added by setProfile.
     _xname          --  Name of the x-variable
     _yname          --  Name of the y-variable
     _dyname         --  Name of the dy-variable
@@ -66,12 +102,27 @@ class FitContribution(ParameterSet):
 
     """
 
+    # Maximum number of residual equations kept in _reseqcache.
+    _reseqcachesize = 8
+
     def __init__(self, name):
         """Initialization."""
         ParameterSet.__init__(self, name)
         self._eq = None
+        self._eqjit = None
+        self._eqmemo = OrderedDict()
+        self._eqmemosize = 0
         self._reseq = None
+        self._reseqkind = None
+        self._reseqcache = OrderedDict()
+        self._resbuf = None
+        self._resdtype = None
+        self._lastres = None
+        self._ycache = None
+        self._invdycache = None
+        self._resvscale = None
         self.profile = None
+        self._profileproxies = ()
         self._xname = None
         self._yname = None
         self._dyname = None
@@ -105,7 +156,11 @@ class FitContribution(ParameterSet):
             raise TypeError(emsg)
 
         # Set the Profile and add its parameters to this organizer.
+        if self.profile is not None:
+            self.profile.removeObserver(self._flushProfile)
         self.profile = profile
+        self.profile.addObserver(self._flushProfile)
+        self._flushProfile()
 
         if xname is None:
             xname = self.profile.xpar.name
@@ -114,16 +169,26 @@ class FitContribution(ParameterSet):
         if dyname is None:
             dyname = self.profile.dypar.name
 
+        # Cached residual equations may refer to the old variable names.
+        if (yname, dyname) != (self._yname, self._dyname):
+            self._clearResidualCache()
+
         self._xname = xname
         self._yname = yname
         self._dyname = dyname
 
-        xpar = ParameterProxy(xname, self.profile.xpar)
-        ypar = ParameterProxy(yname, self.profile.ypar)
-        dypar = ParameterProxy(dyname, self.profile.dypar)
-        self.addParameter(xpar, check = False)
-        self.addParameter(ypar, check = False)
-        self.addParameter(dypar, check = False)
+        # Remove the proxies of the old Profile that do not get replaced.
+        names = (xname, yname, dyname)
+        for par in self._profileproxies:
+            if par.name in names or self._parameters.get(par.name) is not par:
+                continue
+            self._removeParameter(par)
+
+        proxies = (ParameterProxy(xname, self.profile.xpar),
+                   ParameterProxy(yname, self.profile.ypar),
+                   ParameterProxy(dyname, self.profile.dypar))
+        self._addParameters(proxies, check = False)
+        self._profileproxies = proxies
 
         # If we have ProfileGenerators, set their Profiles.
         for gen in self._generators.values():
@@ -165,8 +230,9 @@ class FitContribution(ParameterSet):
         self._eqfactory.registerOperator(name, gen)
         self._addObject(gen, self._generators, True)
 
-        # If we have a profile, set the profile of the generator.
-        if self.profile is not None:
+        # If we have a profile, set the profile of the generator unless it
+        # already uses it.
+        if self.profile is not None and gen.profile is not self.profile:
             gen.setProfile(self.profile)
 
         # Make this our equation if we don't have one. This will set the
@@ -208,7 +274,14 @@ class FitContribution(ParameterSet):
         # Register eq as an operator
         self._eqfactory.registerOperator("eq", eq)
         self._eqfactory.wipeout(self._eq)
+        if self._eq is not None:
+            self._eq.removeObserver(self._flushResidual)
         self._eq = eq
+        self._eq.addObserver(self._flushResidual)
+        self._eqjit = JitEquation(eq) if JIT_ENABLED else None
+        self._eqmemo.clear()
+        self._flushResidual()
+        self._clearResidualCache()
 
         # Set the residual if we need to
         if self.profile is not None and self._reseq is None:
@@ -264,14 +337,38 @@ class FitContribution(ParameterSet):
             eqstr = chivstr
         elif eqstr == "resv":
             eqstr = resvstr
-
-        reseq = equationFromString(eqstr, self._eqfactory)
-        self._eqfactory.wipeout(self._reseq)
+        presets = {chivstr : "chiv", resvstr : "resv"}
+        self._reseqkind = presets.get(eqstr)
+        self._flushResidual()
+
+        # Reuse the residual equation if it was built before.
+        oldreseq = self._reseq
+        reseq = self._reseqcache.pop(eqstr, None)
+        if reseq is None:
+            reseq = equationFromString(eqstr, self._eqfactory)
+        self._reseqcache[eqstr] = reseq
         self._reseq = reseq
+        if not any(oldreseq is eq for eq in self._reseqcache.values()):
+            self._eqfactory.wipeout(oldreseq)
+
+        # Release the least recently used equations.
+        while len(self._reseqcache) > self._reseqcachesize:
+            key = next(iter(self._reseqcache))
+            self._eqfactory.wipeout(self._reseqcache.pop(key))
 
         return
 
 
+    def _clearResidualCache(self):
+        """Release cached residual equations other than the active one.
+        """
+        for reseq in self._reseqcache.values():
+            if reseq is not self._reseq:
+                self._eqfactory.wipeout(reseq)
+        self._reseqcache.clear()
+        return
+
+
     def getResidualEquation(self):
         """Get math expression string for the active residual equation.
 
@@ -299,12 +396,224 @@ class FitContribution(ParameterSet):
         The residual equation can be changed with the setResidualEquation
         method.
 
+        The preset residuals are computed in an array that is reused by the
+        next call, copy the result if it needs to be kept.  The preset
+        residual is also returned again when neither the equation value nor
+        the Profile changed.  Do not modify the returned array.  Long
+        profiles are processed with compiled kernels when numba is
+        installed.
+
+        """
+        # Assign the calculated profile.  The equation returns the same cached
+        # array when its inputs did not change.  Skip the array comparison
+        # in Parameter.setValue for that case.  Access the ycalc Parameter
+        # directly instead of through the Profile.ycalc property.
+        if self._reseqkind is not None:
+            ycalc = self._evaluateEquation()
+        else:
+            ycalc = self._eq()
+        ycpar = self.profile.ycpar
+        if ycalc is not ycpar.getValue():
+            ycpar.setValue(ycalc)
+        if self._reseqkind is None:
+            # Note that equations only recompute when their inputs are
+            # modified, so the following will not recompute the equation.
+            return self._reseq()
+        # Reuse the preset residual until the equation or the Profile change.
+        if self._lastres is None:
+            rv = self._presetResidual(ycalc)
+            # The equation notifies a change only after it was evaluated,
+            # which is not the case for values taken from the memo.
+            if self._eq._value is None:
+                return rv
+            self._lastres = rv
+        return self._lastres
+
+
+    def setResidualDtype(self, dtype):
+        """Set the floating point type for evaluating the preset residuals.
+
+        The profile data are stored as dtype and the chiv or resv residual
+        is computed and returned as dtype.  The profile equation is still
+        evaluated in its own precision.  With a single precision type such
+        as numpy.float32 the residual arithmetic takes less memory traffic,
+        which makes it faster only for long profiles.  Custom residual
+        equations are not affected.
+
+        The residual is then resolved only to about 1e-7 relative.
+        Optimizers that estimate derivatives by finite differences need a
+        step well above that resolution, otherwise the Jacobian is noise
+        and the fit does not converge.  For scipy.optimize.leastsq use
+        epsfcn=1e-7 or larger; the default step is about 1.5e-8.
+
+        dtype   --  A numpy floating point type, or None to restore the
+                    default float64.
+
+        Raises ValueError if dtype is not a floating point type.
+        """
+        if dtype is not None:
+            dtype = numpy.dtype(dtype)
+            if dtype.kind != 'f':
+                emsg = "dtype must be a floating point type."
+                raise ValueError(emsg)
+        self._resdtype = dtype
+        self._flushProfile()
+        return
+
+
+    def setEquationMemo(self, size):
+        """Keep the profile equation values for recent Parameter values.
+
+        When enabled, the preset residuals reuse the value of the profile
+        equation computed for the same values of the equation arguments and
+        of all Parameters in this FitContribution.  This avoids recomputing
+        the profile when the optimizer revisits a point, for example after a
+        finite-difference step.  The memo keeps copies of the equation
+        values.  Array-valued Parameters are compared by identity, so arrays
+        must not be modified in-place.  The memo must not be used with
+        ProfileGenerators or Calculators that depend on anything other than
+        their Parameters.
+
+        size    --  Number of equation values to keep, 0 to disable the memo.
+
+        Raises ValueError if size is negative.
+        """
+        if size < 0:
+            raise ValueError("size must be non-negative")
+        self._eqmemosize = int(size)
+        while len(self._eqmemo) > self._eqmemosize:
+            self._eqmemo.popitem(last=False)
+        return
+
+
+    def _evaluateEquation(self):
+        """Get the value of the profile equation for the preset residuals.
+
+        This uses the compiled equation when enabled and the memo of the
+        recent equation values.
+        """
+        evaluate = self._eq if self._eqjit is None else self._eqjit
+        if not self._eqmemosize:
+            return evaluate()
+        # Keep references to the objects identified by id in the key, so
+        # their ids cannot be reused while the memo entry exists.
+        refs = [self._eq.argdict]
+        key = [id(self._eq.argdict)]
+        for par in chain(self._eq.args, self.iterPars()):
+            v = par.getValue()
+            if numpy.isscalar(v):
+                key.append(v)
+            else:
+                key.append(id(v))
+                refs.append(v)
+        key = tuple(key)
+        entry = self._eqmemo.pop(key, None)
+        if entry is None:
+            ycalc = evaluate()
+            # Store a copy, the equation may reuse its output array.
+            entry = (numpy.copy(ycalc), refs)
+        else:
+            ycalc = entry[0]
+        self._eqmemo[key] = entry
+        while len(self._eqmemo) > self._eqmemosize:
+            self._eqmemo.popitem(last=False)
+        return ycalc
+
+
+    def _presetResidual(self, ycalc):
+        """Evaluate the preset residual without the residual equation.
+
+        ycalc   --  The calculated profile.
+
+        Return the chiv or resv array according to _reseqkind.
+        """
+        y, scale = self._getProfileData()
+        out = self._getResidualBuffer(ycalc, y)
+        if out is None:
+            rv = ycalc - y
+            rv *= scale
+            return rv
+        usekernel = (HAVE_NUMBA and isinstance(ycalc, numpy.ndarray) and
+                     ycalc.shape == y.shape and y.size >= KERNEL_MINSIZE)
+        if usekernel and self._reseqkind == "chiv":
+            return chivKernel(ycalc, y, scale, out)
+        if usekernel:
+            return resvKernel(ycalc, y, scale, out)
+        # ycalc is converted to the type of y without a temporary copy.
+        numpy.subtract(ycalc, y, out=out, dtype=y.dtype)
+        numpy.multiply(out, scale, out=out)
+        return out
+
+
+    def _getProfileData(self):
+        """Get the Profile data for evaluating the preset residuals.
+
+        The arrays are contiguous float copies of the Profile data, of type
+        _resdtype when it is set.  Only the scale of the active preset
+        residual is computed.  The data are cached until the Profile
+        changes.
+
+        Return a tuple of the y array and the scale for ycalc - y, which is
+        the 1/dy array for chiv and 1/sqrt(dot(y, y)) for resv.
+        """
+        dtype = self._resdtype
+        if dtype is None:
+            dtype = numpy.dtype(float)
+        if self._ycache is None:
+            y = numpy.ascontiguousarray(self.profile.y, dtype=dtype)
+            self._ycache = y
+        y = self._ycache
+        if self._reseqkind == "resv":
+            if self._resvscale is None:
+                norm = numpy.sqrt(numpy.dot(y, y))
+                self._resvscale = dtype.type(1.0 / norm)
+            return y, self._resvscale
+        if self._invdycache is None:
+            dy = numpy.ascontiguousarray(self.profile.dy, dtype=dtype)
+            self._invdycache = numpy.reciprocal(dy)
+        return y, self._invdycache
+
+
+    def _flushResidual(self, other=()):
+        """Invalidate the cached preset residual."""
+        self._lastres = None
+        return
+
+
+    def _flushProfile(self, other=()):
+        """Invalidate the cached Profile data and preset residual.
+
+        This is called when the Profile changes.
+        """
+        self._ycache = None
+        self._invdycache = None
+        self._resvscale = None
+        self._eqmemo.clear()
+        self._flushResidual()
+        return
+
+
+    def _getResidualBuffer(self, ycalc, y):
+        """Get output array for the preset residual.
+
+        ycalc   --  The calculated profile.
+        y       --  The observed profile over the calculation range.
+
+        Return an array of the same shape and type as y that is reused
+        between calls.  Return None if the residual of ycalc and y does not
+        fit in such array.  Floating point ycalc is accepted for any type of
+        y when _resdtype is set.
         """
-        # Assign the calculated profile
-        self.profile.ycalc = self._eq()
-        # Note that equations only recompute when their inputs are modified, so
-        # the following will not recompute the equation.
-        return self._reseq()
+        if numpy.shape(ycalc) not in (y.shape, ()):
+            return None
+        rtype = numpy.result_type(ycalc, y)
+        downcast = self._resdtype is not None and rtype.kind == 'f'
+        if rtype != y.dtype and not downcast:
+            return None
+        rb = self._resbuf
+        if rb is None or rb.shape != y.shape or rb.dtype != y.dtype:
+            self._resbuf = numpy.empty_like(y)
+        return self._resbuf
 
 
     def evaluate(self):
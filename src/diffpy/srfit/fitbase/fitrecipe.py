@@ -53,6 +53,14 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
     fithooks        --  List of FitHook instances that can pass information out
                         of the system during a refinement. By default, the is
                         populated by a PrintFitHook instance.
+    parallel        --  Flag for evaluating the FitContribution residuals
+                        concurrently in a thread pool (default False).  This
+                        helps on multiple CPU cores when the residuals spend
+                        their time in code that releases the GIL, that is,
+                        numpy operations on long profiles, the numba residual
+                        kernels and compiled equations.  It must not be used
+                        when FitContributions share ProfileGenerators or
+                        Calculators.  Requires the concurrent.futures module.
     _constraints    --  A dictionary of Constraints, indexed by the constrained
                         Parameter. Constraints can be added using the
                         'constrain' method.
@@ -77,6 +85,8 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
                         FitContribution when determining the overall residual.
     _fixedtag       --  "__fixed", used for tagging variables as fixed. Don't
                         use this tag unless you want issues.
+    _executor       --  ThreadPoolExecutor used when parallel is set, or None.
+                        It is created on first use and kept for later calls.
 
     Properties
     names           --  Variable names (read only). See getNames.
@@ -103,10 +113,12 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
         RecipeOrganizer.__init__(self, name)
         self.fithooks = []
         self.pushFitHook(PrintFitHook())
+        self.parallel = False
         self._restraintlist = []
         self._oconstraints = []
         self._ready = False
         self._fixedtag = "__fixed"
+        self._executor = None
 
         self._weights = []
         self._tagmanager = TagManager()
@@ -234,9 +246,13 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
             con.update()
 
         # Calculate the bare chiv
+        contributions = list(self._contributions.values())
+        if self.parallel and len(contributions) > 1:
+            residuals = self._parallelResiduals(contributions)
+        else:
+            residuals = [ci.residual() for ci in contributions]
         chiv = concatenate([
-            wi * ci.residual().flatten()
-            for wi, ci in zip(self._weights, self._contributions.values())])
+            wi * ri.flatten() for wi, ri in zip(self._weights, residuals)])
 
         # Calculate the point-average chi^2
         w = dot(chiv, chiv)/len(chiv)
@@ -249,6 +265,30 @@ class FitRecipe(_fitrecipe_interface, RecipeOrganizer):
 
         return chiv
 
+    def _parallelResiduals(self, contributions):
+        """Calculate the residuals of FitContributions in a thread pool.
+
+        contributions   --  List of the FitContributions to evaluate.
+
+        Returns the list of residuals in the order of contributions.
+        """
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            from multiprocessing import cpu_count
+            self._executor = ThreadPoolExecutor(max_workers=cpu_count())
+        residuals = list(self._executor.map(
+            lambda ci: ci.residual(), contributions))
+        return residuals
+
+    def __getstate__(self):
+        """Return the state for pickling without the thread pool.
+
+        The thread pool is created again when needed.
+        """
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
     def scalarResidual(self, p = []):
         """Calculate the scalar residual to be optimized.
 
@@ -421,6 +421,31 @@ class RecipeOrganizer(_recipeorganizer_interface, RecipeContainer):
         self._eqfactory.registerArgument(par.name, par)
         return
 
+    def _addParameters(self, pars, check=True):
+        """Store several Parameters.
+
+        This is equivalent to calling _addParameter for each Parameter, but
+        the equations of the _eqfactory are updated only once.
+
+        pars    --  Sequence of Parameters to be stored.
+        check   --  If True (default), a ValueError is raised a Parameter of
+                    the specified name has already been inserted.
+
+        Raises ValueError if a Parameter has no name.
+        Raises ValueError if a Parameter has the same name as a contained
+        RecipeContainer.  The Parameters stored before the error are
+        registered as with consecutive _addParameter calls.
+        """
+        added = []
+        try:
+            for par in pars:
+                RecipeContainer._addObject(self, par, self._parameters, check)
+                added.append(par)
+        finally:
+            # Register the stored Parameters
+            self._eqfactory.registerArguments([(p.name, p) for p in added])
+        return
+
     def _removeParameter(self, par):
         """Remove a parameter.
 
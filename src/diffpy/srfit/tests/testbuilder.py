@@ -53,6 +53,48 @@ class TestBuilder(unittest.TestCase):
         return
 
 
+    def testRegisterArguments(self):
+        """Swap several arguments in a single registration."""
+
+        factory = builder.EquationFactory()
+        v1, v2, v3, v4 = _makeArgs(4)
+
+        factory.registerArgument("v1", v1)
+        factory.registerArgument("v2", v2)
+        eq = factory.makeEquation("v1 + v2")
+        self.assertAlmostEqual(3, eq())
+
+        bs = factory.registerArguments([("v1", v3), ("v2", v4)])
+        self.assertEqual(2, len(bs))
+        self.assertTrue(factory.builders["v1"] is bs[0])
+        self.assertTrue(factory.builders["v2"] is bs[1])
+        self.assertEqual([v3, v4], eq.args)
+        self.assertAlmostEqual(7, eq())
+        self.assertTrue(noObserversInGlobalBuilders())
+        return
+
+
+    def testParseCache(self):
+        """Check equation strings are parsed once for all factories."""
+        eqstr = "v1 + 2 * v2"
+        f1 = builder.EquationFactory()
+        eq1 = f1.makeEquation(eqstr)
+        self.assertTrue(eqstr in builder._tokencache)
+        self.assertTrue(eqstr in builder._codecache)
+        code = builder._codecache[eqstr]
+        f2 = builder.EquationFactory()
+        eq2 = f2.makeEquation(eqstr)
+        self.assertTrue(code is builder._codecache[eqstr])
+        self.assertEqual(set(["v1", "v2"]), set(eq2.argdict))
+        self.assertFalse(eq1.args[0] is eq2.args[0])
+        self.assertRaises(SyntaxError, f1.makeEquation, "v1 + (v2")
+        # leading whitespace is accepted as by eval
+        eq3 = f2.makeEquation(" \tv1 + 1")
+        self.assertTrue(eq3.args[0] is eq2.argdict["v1"])
+        self.assertTrue(" \tv1 + 1" in builder._codecache)
+        return
+
+
     def testRegisterOperator(self):
         """Try to use an operator without arguments in an equation."""
 
@@ -16,15 +16,21 @@
 """Tests for refinableobj module."""
 
 import unittest
+import warnings
 
-from numpy import arange, dot, array_equal, sin
+import numpy
+from numpy import arange, dot, array_equal, sin, allclose, linspace
 
 from diffpy.srfit.fitbase.fitcontribution import FitContribution
+from diffpy.srfit.fitbase.fitrecipe import FitRecipe
+from diffpy.srfit.fitbase._equationjit import JitEquation, generateSource
+from diffpy.srfit.fitbase._residualkernels import HAVE_NUMBA
 from diffpy.srfit.fitbase.profilegenerator import ProfileGenerator
 from diffpy.srfit.fitbase.profile import Profile
 from diffpy.srfit.fitbase.parameter import Parameter
 from diffpy.srfit.exceptions import SrFitError
 from diffpy.srfit.tests.utils import noObserversInGlobalBuilders
+from diffpy.srfit.tests.utils import has_scipy, _msg_noscipy
 
 
 class TestContribution(unittest.TestCase):
@@ -54,6 +60,14 @@ class TestContribution(unittest.TestCase):
         fc2.setEquation('A * x')
         fc2.setProfile(profile)
         self.assertFalse(fc2._reseq is None)
+        # check the old variables are removed when names change
+        profile2 = Profile()
+        fc.setProfile(profile2, xname='r', yname='y', dyname='dG')
+        self.assertTrue(fc.r.par is profile2.xpar)
+        self.assertTrue(fc.y.par is profile2.ypar)
+        self.assertTrue(fc.dG.par is profile2.dypar)
+        self.assertEqual(None, fc.get('x'))
+        self.assertEqual(None, fc.get('dy'))
         return
 
 
@@ -67,6 +81,19 @@ class TestContribution(unittest.TestCase):
 
         self.assertTrue(gen.profile is None)
         self.assertTrue(fc._eq is not None)
+
+        # generator added after the profile gets the profile
+        fc.setProfile(self.profile)
+        gen2 = ProfileGenerator("gen2")
+        fc.addProfileGenerator(gen2)
+        self.assertTrue(gen2.profile is self.profile)
+        # generator that already uses the profile is not set again
+        gen3 = ProfileGenerator("gen3")
+        gen3.setProfile(self.profile)
+        calls = []
+        gen3.setProfile = calls.append
+        fc.addProfileGenerator(gen3)
+        self.assertEqual([], calls)
         return
 
     def testInteraction(self):
@@ -277,6 +304,247 @@ class TestContribution(unittest.TestCase):
         return
 
 
+    def test_reuseResidualEquations(self):
+        """Check residual equations are reused for the same formula.
+        """
+        fc = self.fitcontribution
+        fc.setProfile(self.profile)
+        fc.setEquation('A * x')
+        chiv = fc._reseq
+        fc.setResidualEquation('resv')
+        resv = fc._reseq
+        self.assertFalse(chiv is resv)
+        fc.setResidualEquation('chiv')
+        self.assertTrue(fc._reseq is chiv)
+        fc.setResidualEquation('resv')
+        self.assertTrue(fc._reseq is resv)
+        self.assertEqual(3, len(fc._eqfactory.equations))
+        # changing the profile equation releases the inactive ones
+        fc.setEquation('B * x')
+        self.assertTrue(fc._reseq is resv)
+        self.assertEqual(2, len(fc._eqfactory.equations))
+        fc.setResidualEquation('chiv')
+        self.assertFalse(fc._reseq is chiv)
+        self.assertEqual(2, len(fc._eqfactory.equations))
+        self.assertEqual('((eq - y) / dy)', fc.getResidualEquation())
+        return
+
+
+    def test_presetResiduals(self):
+        """Check preset residuals agree with their residual equations.
+        """
+        fc = self.fitcontribution
+        xobs = arange(0, 10, 0.5)
+        self.profile.setObservedProfile(xobs, sin(xobs), 0.1 + xobs)
+        fc.setProfile(self.profile)
+        fc.setEquation('A * x')
+        fc.A.setValue(0.3)
+        self.assertEqual('chiv', fc._reseqkind)
+        self.assertTrue(allclose(fc._reseq(), fc.residual()))
+        fc.setResidualEquation('resv')
+        self.assertEqual('resv', fc._reseqkind)
+        self.assertTrue(allclose(fc._reseq(), fc.residual()))
+        fc.setResidualEquation('(eq - y)/dy')
+        self.assertEqual('chiv', fc._reseqkind)
+        fc.setResidualEquation('2 * (eq - y)')
+        self.assertTrue(fc._reseqkind is None)
+        self.assertTrue(allclose(2 * (0.3 * xobs - sin(xobs)),
+                                 fc.residual()))
+        # long profiles may use the compiled kernels
+        xobs = linspace(0, 10, 2000)
+        self.profile.setObservedProfile(xobs, sin(xobs), 0.1 + xobs)
+        for kind in ('chiv', 'resv'):
+            fc.setResidualEquation(kind)
+            self.assertTrue(allclose(fc._reseq(), fc.residual()))
+        return
+
+
+    def test_residualReuse(self):
+        """Check the preset residual is recomputed only after changes.
+        """
+        fc = self.fitcontribution
+        xobs = arange(0, 10, 0.5)
+        self.profile.setObservedProfile(xobs, 2 * xobs)
+        fc.setProfile(self.profile)
+        fc.setEquation('A * x')
+        fc.A.setValue(3)
+        chiv = fc.residual()
+        self.assertTrue(chiv is fc.residual())
+        self.assertAlmostEqual(dot(xobs, xobs), dot(chiv, chiv))
+        fc.A.setValue(2)
+        chiv1 = fc.residual()
+        self.assertAlmostEqual(0, dot(chiv1, chiv1))
+        # profile changes invalidate the cached residual
+        self.profile.setObservedProfile(xobs, 3 * xobs)
+        chiv2 = fc.residual()
+        self.assertAlmostEqual(dot(xobs, xobs), dot(chiv2, chiv2))
+        self.profile.dy = 0.5 * self.profile.dy
+        chiv3 = fc.residual()
+        self.assertAlmostEqual(4 * dot(xobs, xobs), dot(chiv3, chiv3))
+        # the resv norm follows changes of y
+        fc.setResidualEquation('resv')
+        self.assertTrue(allclose(fc._reseq(), fc.residual()))
+        self.profile.y = 4 * xobs
+        self.assertTrue(allclose(fc._reseq(), fc.residual()))
+        return
+
+
+    def test_residualInPlaceGenerator(self):
+        """Check the preset residual follows generators with output buffers.
+        """
+        class BufferGenerator(ProfileGenerator):
+            def __init__(self, name):
+                ProfileGenerator.__init__(self, name)
+                self.newParameter("a", 1.0)
+                self.buf = None
+                return
+            def __call__(self, x):
+                if self.buf is None or self.buf.shape != x.shape:
+                    self.buf = x.copy()
+                numpy.multiply(x, self.a.value, out=self.buf)
+                return self.buf
+        fc = self.fitcontribution
+        xobs = arange(0, 10, 0.5)
+        self.profile.setObservedProfile(xobs, 2 * xobs)
+        fc.setProfile(self.profile)
+        gen = BufferGenerator("g")
+        fc.addProfileGenerator(gen)
+        chiv = fc.residual()
+        self.assertAlmostEqual(dot(xobs, xobs), dot(chiv, chiv))
+        gen.a.setValue(3.0)
+        chiv = fc.residual()
+        self.assertAlmostEqual(dot(xobs, xobs), dot(chiv, chiv))
+        self.assertTrue(allclose(xobs, chiv))
+        gen.a.setValue(2.0)
+        chiv = fc.residual()
+        self.assertAlmostEqual(0, dot(chiv, chiv))
+        return
+
+
+    def test_presetResidualScale(self):
+        """Check only the scale of the active preset residual is computed.
+        """
+        fc = self.fitcontribution
+        xobs = arange(0, 10, 0.5)
+        self.profile.setObservedProfile(xobs, 0 * xobs)
+        fc.setProfile(self.profile)
+        fc.setEquation('A * x')
+        fc.A.setValue(2)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            chiv = fc.residual()
+        self.assertTrue(allclose(2 * xobs, chiv))
+        self.assertTrue(fc._resvscale is None)
+        fc.setResidualEquation('resv')
+        self.profile.setObservedProfile(xobs, xobs, 0 * xobs)
+        fc.residual()
+        self.assertTrue(fc._invdycache is None)
+        self.assertFalse(fc._resvscale is None)
+        return
+
+
+    def test_setResidualDtype(self):
+        """Check the preset residuals in single precision.
+        """
+        fc = self.fitcontribution
+        xobs = linspace(0, 10, 2000)
+        self.profile.setObservedProfile(xobs, 2 * sin(xobs), 0.5 + xobs)
+        fc.setProfile(self.profile)
+        fc.setEquation('A * sin(x)')
+        fc.A.setValue(3)
+        chiv = fc.residual().copy()
+        self.assertRaises(ValueError, fc.setResidualDtype, int)
+        fc.setResidualDtype('float32')
+        chiv32 = fc.residual()
+        self.assertEqual('float32', chiv32.dtype)
+        self.assertTrue(allclose(chiv, chiv32, rtol=1e-5, atol=1e-6))
+        fc.setResidualEquation('resv')
+        resv32 = fc.residual()
+        self.assertEqual('float32', resv32.dtype)
+        self.assertTrue(allclose(fc._reseq(), resv32, rtol=1e-5, atol=1e-6))
+        fc.setResidualDtype(None)
+        self.assertEqual('float64', fc.residual().dtype)
+        return
+
+
+    @unittest.skipUnless(has_scipy, _msg_noscipy)
+    def test_setResidualDtypeFit(self):
+        """Check a leastsq fit converges with single precision residuals.
+        """
+        from scipy.optimize import leastsq
+        x = linspace(0, 10, 3000)
+        rs = numpy.random.RandomState(0)
+        y = 3 * numpy.exp(-0.5 * (x - 4)**2) + 0.1 + rs.normal(0, 0.1, x.size)
+        self.profile.setObservedProfile(x, y, 0.1 + 0 * x)
+        fc = self.fitcontribution
+        fc.setProfile(self.profile)
+        fc.setEquation('A * exp(-0.5 * (x - x0)**2 / w**2) + B')
+        recipe = FitRecipe()
+        recipe.fithooks[0].verbose = 0
+        recipe.addContribution(fc)
+        results = []
+        for dtype in (None, 'float32'):
+            fc.setResidualDtype(dtype)
+            for name, value in (('A', 2), ('x0', 3.5), ('w', 1.5), ('B', 0)):
+                recipe.addVar(getattr(fc, name), value)
+            # single precision needs a finite-difference step above 1e-7
+            p, ier = leastsq(recipe.residual, recipe.values, epsfcn=1e-7)
+            self.assertTrue(ier in (1, 2, 3, 4))
+            results.append(p)
+            for name in ('A', 'x0', 'w', 'B'):
+                recipe.delVar(getattr(recipe, name))
+        self.assertTrue(allclose([3, 4, 1, 0.1], results[0], atol=0.02))
+        self.assertTrue(allclose(results[0], results[1], atol=1e-4))
+        return
+
+
+    def test_setEquationMemo(self):
+        """Check the profile equation values are reused for old parameters.
+        """
+        fc = self.fitcontribution
+        xobs = arange(0, 10, 0.5)
+        self.profile.setObservedProfile(xobs, 2 * xobs)
+        fc.setProfile(self.profile)
+        calls = []
+        def f(A, x):
+            calls.append(A)
+            return A * x
+        fc.registerFunction(f)
+        fc.setEquation('f(A, x)')
+        self.assertRaises(ValueError, fc.setEquationMemo, -1)
+        fc.setEquationMemo(2)
+        fc.A.setValue(3)
+        chiv = fc.residual().copy()
+        fc.A.setValue(2)
+        fc.residual()
+        fc.A.setValue(3)
+        self.assertTrue(array_equal(chiv, fc.residual()))
+        self.assertEqual([3, 2], calls)
+        # oldest values are evicted
+        fc.A.setValue(4)
+        fc.residual()
+        fc.A.setValue(2)
+        fc.residual()
+        self.assertEqual([3, 2, 4, 2], calls)
+        # profile changes clear the memo
+        self.profile.setObservedProfile(xobs, 3 * xobs)
+        self.assertEqual(0, len(fc._eqmemo))
+        fc.residual()
+        fc.setEquationMemo(0)
+        self.assertEqual(0, len(fc._eqmemo))
+        # parameters passed in the ns dictionary are part of the key
+        k = Parameter("k", 1.0)
+        fc.setEquation("k * x", ns={"k" : k})
+        fc.setEquationMemo(4)
+        chiv1 = fc.residual().copy()
+        k.setValue(3.0)
+        chiv3 = fc.residual().copy()
+        self.assertTrue(allclose(chiv1 + 2 * xobs, chiv3))
+        k.setValue(1.0)
+        self.assertTrue(array_equal(chiv1, fc.residual()))
+        return
+
+
     def test_registerFunction(self):
         """Ensure registered function works after second setEquation call.
         """
@@ -294,6 +562,85 @@ class TestContribution(unittest.TestCase):
         self.assertEqual(6, fc.evaluate())
         return
 
+# End of class TestContribution
+
+
+class TestJitEquation(unittest.TestCase):
+
+    def setUp(self):
+        self.fc = FitContribution("test")
+        self.fc.setEquation("A * exp(-0.5 * (x - x0)**2) + G")
+        return
+
+
+    def test_generateSource(self):
+        """Check translation of the equation tree to python source."""
+        src, inputs = generateSource(self.fc._eq)
+        self.assertEqual(['A', 'x', 'x0', 'G'], [a.name for a in inputs])
+        self.assertTrue(src.startswith('def _jitfunc(a0, a1, a2, a3):'))
+        self.assertTrue('numpy.exp(numpy.multiply(-0.5, ' in src)
+        # python functions are evaluated outside of the compiled code
+        self.fc.registerFunction(lambda x : 2 * x, name='f', argnames=['x'])
+        self.fc.setEquation("A + f")
+        src, inputs = generateSource(self.fc._eq)
+        self.assertEqual(['A', 'f'], [a.name for a in inputs])
+        self.assertTrue(src.endswith('return numpy.add(a0, a1)\n'))
+        # named constants are inputs, their value can change
+        self.fc.setEquation("A * x + 2")
+        self.fc.A.setConst(True, 2.0)
+        src, inputs = generateSource(self.fc._eq)
+        self.assertEqual(['A', 'x'], [a.name for a in inputs])
+        self.assertTrue(src.endswith(
+            'return numpy.add(numpy.multiply(a0, a1), 2)\n'))
+        return
+
+
+    @unittest.skipUnless(HAVE_NUMBA, "numba is not installed")
+    def test___call__(self):
+        """Check evaluation of the compiled equation."""
+        fc = self.fc
+        jeq = JitEquation(fc._eq)
+        fc.A.setValue(2)
+        fc.x.setValue(arange(0, 10, 0.5))
+        fc.x0.setValue(3)
+        fc.G.setValue(1)
+        self.assertTrue(allclose(fc._eq(), jeq()))
+        self.assertTrue(jeq() is jeq())
+        fc.x0.setValue(4)
+        self.assertTrue(allclose(fc._eq(), jeq()))
+        fc.removeParameter(fc.G)
+        fc.newParameter('G', 5)
+        self.assertTrue(allclose(fc._eq(), jeq()))
+        # compiled code releases the GIL for FitRecipe.parallel
+        from diffpy.srfit.fitbase._residualkernels import chivKernel
+        self.assertTrue(chivKernel.targetoptions['nogil'])
+        self.assertTrue(jeq._func.targetoptions['nogil'])
+        return
+
+
+    @unittest.skipUnless(HAVE_NUMBA, "numba is not installed")
+    def test_residual(self):
+        """Check the FitContribution residual with the compiled equation."""
+        fc = self.fc
+        x = arange(0, 10, 0.5)
+        profile = Profile()
+        profile.setObservedProfile(x, 0 * x)
+        fc.setProfile(profile)
+        fc._eqjit = JitEquation(fc._eq)
+        fc.A.setValue(2)
+        fc.x0.setValue(3)
+        fc.G.setConst(True, 2.0)
+        self.assertTrue(allclose(fc._eq(), fc.residual()))
+        fc.x0.setValue(4)
+        self.assertTrue(allclose(fc._eq(), fc.residual()))
+        # changes of constant parameters are followed
+        fc.G.setValue(5.0)
+        self.assertTrue(allclose(fc._eq(), fc.residual()))
+        self.assertTrue(allclose(fc._eq(), fc._eqjit()))
+        return
+
+# End of class TestJitEquation
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -15,6 +15,7 @@
 
 """Tests for refinableobj module."""
 
+import pickle
 import unittest
 
 from numpy import linspace, array_equal, pi, sin, dot
@@ -240,6 +241,44 @@ class TestFitRecipe(unittest.TestCase):
         return
 
 
+    def testParallelResidual(self):
+        """Check the residual is the same when evaluated in threads."""
+        recipe = self.recipe
+        profile2 = Profile()
+        x = linspace(0, pi, 20)
+        profile2.setObservedProfile(x, 2 * sin(x))
+        cont2 = FitContribution("cont2")
+        cont2.setProfile(profile2)
+        cont2.setEquation("B*sin(x)")
+        cont2.B.setValue(1)
+        recipe.addContribution(cont2, weight=0.5)
+        recipe.cont.c.setValue(1)
+        self.assertFalse(recipe.parallel)
+        res = recipe.residual().copy()
+        recipe.parallel = True
+        self.assertTrue(array_equal(res, recipe.residual()))
+        cont2.B.setValue(3)
+        res2 = recipe.residual().copy()
+        # the thread pool is kept for later calls
+        executor = recipe._executor
+        self.assertTrue(executor is not None)
+        cont2.B.setValue(2)
+        recipe.residual()
+        self.assertTrue(executor is recipe._executor)
+        cont2.B.setValue(3)
+        recipe.parallel = False
+        self.assertTrue(array_equal(res2, recipe.residual()))
+        self.assertEqual(30, len(res2))
+        # the thread pool is not pickled
+        recipe.parallel = True
+        recipe2 = pickle.loads(pickle.dumps(recipe))
+        self.assertTrue(recipe2._executor is None)
+        self.assertTrue(recipe._executor is executor)
+        self.assertTrue(array_equal(res2, recipe2.residual()))
+        self.assertTrue(recipe2._executor is not None)
+        return
+
+
     def testPrintFitHook(self):
         "check output from default PrintFitHook."
         self.recipe.addVar(self.fitcontribution.c)
@@ -225,6 +225,29 @@ class TestRecipeOrganizer(unittest.TestCase):
 
         return
 
+    def testAddParameters(self):
+        """Test the _addParameters method."""
+
+        m = self.m
+
+        p1 = Parameter("p1", 1)
+        p2 = Parameter("p2", 2)
+        m._addParameters([p1, p2])
+        self.assertTrue(m.p1 is p1)
+        self.assertTrue(m._eqfactory.builders["p2"].literal is p2)
+
+        # Parameters before a duplicate name are stored and registered
+        p3 = Parameter("p3", 3)
+        p4 = Parameter("p4", 4)
+        self.assertRaises(ValueError, m._addParameters,
+                [p3, Parameter("p1", 0), p4])
+        self.assertTrue(m.p3 is p3)
+        self.assertTrue(m._eqfactory.builders["p3"].literal is p3)
+        self.assertTrue(m.p1 is p1)
+        self.assertFalse("p4" in m._parameters)
+        self.assertFalse("p4" in m._eqfactory.builders)
+        return
+
     def testRemoveParameter(self):
         """Test removeParameter method."""
 
@@ -410,6 +433,12 @@ class TestRecipeOrganizer(unittest.TestCase):
         eq = self.m.registerStringFunction("g/x - 1", "pdf")
         self.assertTrue(numpy.array_equal(g(x)/x - 1, eq()))
 
+        # The value is kept until a parameter changes
+        gval = g.value
+        self.assertTrue(gval is g.getValue())
+        self.m.g.center.setValue(3.0)
+        self.assertFalse(gval is g.getValue())
+        self.assertTrue(numpy.array_equal(g(x), g.value))
         return
 
     def testRegisterFunction(self):
@@ -67,6 +67,16 @@ except ImportError:
     has_srreal = False
     logger.warning('Cannot import diffpy.srreal, PDF tests skipped.')
 
+# scipy
+
+_msg_noscipy = "No module named 'scipy'"
+try:
+    import scipy.optimize as m; del m
+    has_scipy = True
+except ImportError:
+    has_scipy = False
+    logger.warning('Cannot import scipy, optimizer tests skipped.')
+
 # Helper functions for testing -----------------------------------------------
 
 def _makeArgs(num):